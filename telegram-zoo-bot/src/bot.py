@@ -1,18 +1,37 @@
+import asyncio
 import logging
 import os
 import sys
-import json
 from dataclasses import dataclass
-from typing import List
+from typing import Tuple
+from urllib.parse import quote
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
+from telegram.ext import AIORateLimiter, Application, CommandHandler, CallbackQueryHandler, ContextTypes
 from dotenv import load_dotenv
 
+# Use the fastest available JSON parser
+try:
+    import orjson as _json
+except ImportError:
+    try:
+        import ujson as _json
+    except ImportError:
+        import json as _json
+
+# uvloop is a faster asyncio event loop; it is POSIX-only, so on Windows
+# the default asyncio loop is used
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 # Load environment variables
 load_dotenv()
 
 BOT_TOKEN = os.getenv('BOT_TOKEN')
 ADMIN_CHAT_ID = os.getenv('ADMIN_CHAT_ID')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+PORT = os.getenv('PORT')
 
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN not found in environment variables")
@@ -22,38 +41,37 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
     level=logging.INFO
 )
+# httpx logs every Bot API request at INFO level, which floods the log while polling
+logging.getLogger('httpx').setLevel(logging.WARNING)
+logging.getLogger('telegram.ext').setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Animal:
     name: str
     description: str
     image_url: str
-    traits: List[str] = None
+    traits: Tuple[str, ...] = ()
     adoption_info: str = ""
-    
-    def __post_init__(self):
-        if self.traits is None:
-            self.traits = []
 
 # Load data
 def load_animals():
     try:
-        with open('data/animals.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        return [Animal(**animal) for animal in data]
+        with open('data/animals.json', 'rb') as f:
+            data = _json.loads(f.read())
+        return [Animal(**{**animal, 'traits': tuple(animal.get('traits') or ())}) for animal in data]
     except FileNotFoundError:
         # Fallback animals if file not found
         return [
-            Animal("Амурский тигр", "Величественный хищник", "", ["Сильный", "Независимый"]),
-            Animal("Красная панда", "Милый пушистый зверёк", "", ["Игривый", "Спокойный"]),
-            Animal("Снежный барс", "Неуловимый горный хищник", "", ["Ловкий", "Загадочный"]),
+            Animal("Амурский тигр", "Величественный хищник", "", ("Сильный", "Независимый")),
+            Animal("Красная панда", "Милый пушистый зверёк", "", ("Игривый", "Спокойный")),
+            Animal("Снежный барс", "Неуловимый горный хищник", "", ("Ловкий", "Загадочный")),
         ]
 
 def load_questions():
     try:
-        with open('data/questions.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
+        with open('data/questions.json', 'rb') as f:
+            return _json.loads(f.read())
     except FileNotFoundError:
         # Fallback questions
         return [
@@ -67,16 +85,121 @@ def load_questions():
             }
         ]
 
+def build_result_message(result_animal: Animal) -> str:
+    """Build the result text for an animal."""
+    traits_block = ""
+    if result_animal.traits:
+        traits_block = "✨ **Ваши качества:**\n" + "".join(f"• {trait}\n" for trait in result_animal.traits[:3]) + "\n"
+    
+    return (
+        f"🎯 **Ваше тотемное животное: {result_animal.name}!**\n\n"
+        f"📖 {result_animal.description}\n\n"
+        f"{traits_block}"
+        "🤝 **Хотите стать опекуном?**\n"
+        "Программа опеки Московского зоопарка позволяет вам поддержать любимое животное!"
+    )
+
 # Global data
 ANIMALS = load_animals()
 QUESTIONS = load_questions()
 
-# Handlers
-async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handle the /start command."""
-    user = update.effective_user
-    
-    welcome_text = f"""🦁 Добро пожаловать, {user.first_name}!
+# Per-animal data, indexed like ANIMALS
+ANIMAL_NAMES = [animal.name for animal in ANIMALS]
+RESULT_MESSAGES = [build_result_message(animal) for animal in ANIMALS]
+
+# The result only depends on the answer sum, whose range is fixed by the
+# questions, so (message, animal index) is precomputed for every possible score
+MAX_SCORE = sum(len(question['answers']) - 1 for question in QUESTIONS)
+RESULT_CACHE = [
+    (RESULT_MESSAGES[score % len(ANIMALS)], score % len(ANIMALS))
+    for score in range(MAX_SCORE + 1)
+]
+
+# Static screens
+ABOUT_TEXT_HTML = """🤝 <b>Программа опеки Московского зоопарка</b>
+
+Станьте опекуном животного и помогите зоопарку!
+
+<b>Что вы получите:</b>
+🎁 Именной сертификат опекуна
+📱 Эксклюзивные фото и видео
+📧 Регулярные отчёты
+🎟 Льготные билеты
+👥 Закрытые мероприятия
+
+Узнать больше: https://moscowzoo.ru"""
+
+CONTACT_TEXT_HTML = """📞 <b>Связь с Московским зоопарком</b>
+
+📧 Email: info@moscowzoo.ru
+📱 Телефон: +7 (495) 255-53-75
+🌐 Сайт: moscowzoo.ru
+📍 Адрес: Большая Грузинская ул., 1
+
+🕘 Режим работы: Пн-Вс 9:00-17:00"""
+
+GUARDIAN_TEXT_HTML = """🤝 <b>Стать опекуном</b>
+
+Поддержите животных зоопарка!
+Узнайте больше на сайте зоопарка.
+
+🌐 moscowzoo.ru/guardianship"""
+
+# Keyboards are immutable, so build them once at startup
+START_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🚀 Начать викторину", callback_data="start_quiz")],
+    [InlineKeyboardButton("ℹ️ О программе опеки", callback_data="about_program")],
+    [InlineKeyboardButton("📞 Связаться с зоопарком", callback_data="contact")]
+])
+
+RESULT_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔄 Пройти ещё раз", callback_data="start_quiz")],
+    [InlineKeyboardButton("📤 Поделиться", callback_data="share_result")],
+    [InlineKeyboardButton("🤝 Стать опекуном", callback_data="become_guardian")]
+])
+
+ABOUT_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🚀 Пройти викторину", callback_data="start_quiz")],
+    [InlineKeyboardButton("◀️ Назад", callback_data="back_to_start")]
+])
+
+CONTACT_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("◀️ Назад", callback_data="back_to_start")]
+])
+
+GUARDIAN_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🌐 Перейти на сайт", url="https://moscowzoo.ru")],
+    [InlineKeyboardButton("◀️ Назад", callback_data="back_to_result")]
+])
+
+# Share keyboard for every animal, with the share text URL-encoded
+SHARE_MARKUPS = [
+    InlineKeyboardMarkup([
+        [InlineKeyboardButton(
+            "📱 Поделиться",
+            url="https://t.me/share/url?text=" + quote(f"🎯 Я прошёл викторину зоопарка!\nМоё тотемное животное: {name}")
+        )],
+        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_result")]
+    ])
+    for name in ANIMAL_NAMES
+]
+
+# (text, keyboard) for every question screen; answer buttons carry the
+# question number so presses can be matched to the question they belong to
+QUESTION_SCREENS = [
+    (
+        f"❓ **Вопрос {q_index + 1} из {len(QUESTIONS)}**\n\n{question['question']}",
+        InlineKeyboardMarkup([
+            [InlineKeyboardButton(answer, callback_data=f"answer_{q_index}_{i}")]
+            for i, answer in enumerate(question['answers'])
+        ])
+    )
+    for q_index, question in enumerate(QUESTIONS)
+]
+
+def get_welcome_text(first_name: str) -> str:
+    """Build the greeting shown on the start screen."""
+    return f"""🦁 Добро пожаловать, {first_name}!
 
 🎪 **Викторина "Какое ваше тотемное животное?"**
 
@@ -85,45 +208,47 @@ async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 🎯 Отвечайте честно на вопросы, и мы подберём для вас идеальное животное.
 
 Готовы начать?"""
+
+# Handlers
+def answer_in_background(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Acknowledge the button press without waiting for Telegram's reply."""
+    # Application.create_task keeps a reference to the task and reports its errors
+    context.application.create_task(update.callback_query.answer(), update=update)
+
+async def start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle the /start command."""
+    welcome_text = get_welcome_text(update.effective_user.first_name)
+    
+    await update.message.reply_text(welcome_text, reply_markup=START_MARKUP, parse_mode='Markdown')
+
+async def back_to_start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Return to the start screen."""
+    query = update.callback_query
+    answer_in_background(update, context)
     
-    keyboard = [
-        [InlineKeyboardButton("🚀 Начать викторину", callback_data="start_quiz")],
-        [InlineKeyboardButton("ℹ️ О программе опеки", callback_data="about_program")],
-        [InlineKeyboardButton("📞 Связаться с зоопарком", callback_data="contact")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    welcome_text = get_welcome_text(update.effective_user.first_name)
     
-    await update.message.reply_text(welcome_text, reply_markup=reply_markup, parse_mode='Markdown')
+    await query.edit_message_text(welcome_text, reply_markup=START_MARKUP, parse_mode='Markdown')
 
 async def start_quiz_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Start the quiz."""
     query = update.callback_query
-    await query.answer()
+    answer_in_background(update, context)
     
-    context.user_data['questions'] = QUESTIONS
     context.user_data['current_question'] = 0
-    context.user_data['answers'] = []
+    context.user_data['score'] = 0
     
     await show_question(update, context)
 
 async def show_question(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show current question."""
-    questions = context.user_data['questions']
     current_q = context.user_data['current_question']
     
-    if current_q >= len(questions):
+    if current_q >= len(QUESTIONS):
         await show_result(update, context)
         return
     
-    question = questions[current_q]
-    
-    question_text = f"❓ **Вопрос {current_q + 1} из {len(questions)}**\n\n{question['question']}"
-    
-    keyboard = []
-    for i, answer in enumerate(question['answers']):
-        keyboard.append([InlineKeyboardButton(answer, callback_data=f"answer_{i}")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    question_text, reply_markup = QUESTION_SCREENS[current_q]
     
     if update.callback_query:
         await update.callback_query.edit_message_text(
@@ -135,156 +260,157 @@ async def show_question(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def answer_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle quiz answers."""
     query = update.callback_query
-    await query.answer()
-    
-    answer_index = int(query.data.split('_')[1])
+    answer_in_background(update, context)
+    
+    # Callback data is "answer_<question>_<answer>"
+    q_part, _, answer_part = query.data[7:].partition('_')
+    q_index = int(q_part)
+    answer_index = int(answer_part)
+    
+    # None if user_data is empty, e.g. after a bot restart
+    current_q = context.user_data.get('current_question')
+    # Updates run concurrently, so a double tap or a stale keyboard can deliver
+    # a press for a question that is already answered; only score presses for
+    # the current question, which also keeps the score within the result table.
+    # Skipped presses leave the message alone: re-sending the same text would
+    # fail with "Message is not modified"
+    if (q_index != current_q or current_q >= len(QUESTIONS)
+            or answer_index >= len(QUESTIONS[current_q]['answers'])):
+        return
     
-    context.user_data['answers'].append(answer_index)
-    context.user_data['current_question'] += 1
+    context.user_data['score'] += answer_index
+    context.user_data['current_question'] = current_q + 1
     
     await show_question(update, context)
 
 async def show_result(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show quiz result."""
     query = update.callback_query
-    answers = context.user_data['answers']
-    
-    # Calculate result
-    total_score = sum(answers)
-    animal_index = total_score % len(ANIMALS)
-    result_animal = ANIMALS[animal_index]
+    result_message, result_index = RESULT_CACHE[context.user_data['score']]
     
     # Store result
-    context.user_data['result_animal'] = result_animal
-    
-    result_message = f"🎯 **Ваше тотемное животное: {result_animal.name}!**\n\n"
-    result_message += f"📖 {result_animal.description}\n\n"
-    
-    if result_animal.traits:
-        result_message += "✨ **Ваши качества:**\n"
-        for trait in result_animal.traits[:3]:
-            result_message += f"• {trait}\n"
-        result_message += "\n"
+    context.user_data['result_index'] = result_index
     
-    result_message += "🤝 **Хотите стать опекуном?**\n"
-    result_message += "Программа опеки Московского зоопарка позволяет вам поддержать любимое животное!"
+    await query.edit_message_text(
+        result_message, 
+        reply_markup=RESULT_MARKUP, 
+        parse_mode='Markdown'
+    )
+
+async def back_to_result_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Return to the quiz result."""
+    query = update.callback_query
+    answer_in_background(update, context)
     
-    keyboard = [
-        [InlineKeyboardButton("🔄 Пройти ещё раз", callback_data="start_quiz")],
-        [InlineKeyboardButton("📤 Поделиться", callback_data="share_result")],
-        [InlineKeyboardButton("🤝 Стать опекуном", callback_data="become_guardian")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    result_index = context.user_data.get('result_index')
+    if result_index is None:
+        await query.edit_message_text("Ошибка: пройдите викторину заново.")
+        return
     
+    # Show the stored result; the live score may belong to a newer quiz
     await query.edit_message_text(
-        result_message, 
-        reply_markup=reply_markup, 
+        RESULT_MESSAGES[result_index], 
+        reply_markup=RESULT_MARKUP, 
         parse_mode='Markdown'
     )
 
 async def about_program_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle about program."""
     query = update.callback_query
-    await query.answer()
+    answer_in_background(update, context)
     
-    about_text = """🤝 **Программа опеки Московского зоопарка**
-
-Станьте опекуном животного и помогите зоопарку!
-
-**Что вы получите:**
-🎁 Именной сертификат опекуна
-📱 Эксклюзивные фото и видео
-📧 Регулярные отчёты
-🎟 Льготные билеты
-👥 Закрытые мероприятия
-
-Узнать больше: https://moscowzoo.ru"""
-    
-    keyboard = [
-        [InlineKeyboardButton("🚀 Пройти викторину", callback_data="start_quiz")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_start")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await query.edit_message_text(about_text, reply_markup=reply_markup, parse_mode='Markdown')
+    await query.edit_message_text(ABOUT_TEXT_HTML, reply_markup=ABOUT_MARKUP, parse_mode='HTML')
 
 async def share_result_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle sharing."""
     query = update.callback_query
-    await query.answer()
+    answer_in_background(update, context)
     
-    result_animal = context.user_data.get('result_animal')
-    if not result_animal:
+    result_index = context.user_data.get('result_index')
+    if result_index is None:
         await query.edit_message_text("Ошибка: пройдите викторину заново.")
         return
     
-    share_text = f"🎯 Я прошёл викторину зоопарка!\nМоё тотемное животное: {result_animal.name}"
-    
-    keyboard = [
-        [InlineKeyboardButton("📱 Поделиться", 
-                            url=f"https://t.me/share/url?text={share_text}")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_result")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await query.edit_message_text("Поделитесь результатом:", reply_markup=reply_markup)
+    await query.edit_message_text("Поделитесь результатом:", reply_markup=SHARE_MARKUPS[result_index])
 
 async def contact_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle contact."""
     query = update.callback_query
-    await query.answer()
-    
-    contact_text = """📞 **Связь с Московским зоопарком**
-
-📧 Email: info@moscowzoo.ru
-📱 Телефон: +7 (495) 255-53-75
-🌐 Сайт: moscowzoo.ru
-📍 Адрес: Большая Грузинская ул., 1
-
-🕘 Режим работы: Пн-Вс 9:00-17:00"""
-    
-    keyboard = [
-        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_start")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    answer_in_background(update, context)
     
-    await query.edit_message_text(contact_text, reply_markup=reply_markup, parse_mode='Markdown')
+    await query.edit_message_text(CONTACT_TEXT_HTML, reply_markup=CONTACT_MARKUP, parse_mode='HTML')
 
 async def become_guardian_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle becoming guardian."""
     query = update.callback_query
-    await query.answer()
+    answer_in_background(update, context)
     
-    guardian_text = """🤝 **Стать опекуном**
+    await query.edit_message_text(GUARDIAN_TEXT_HTML, reply_markup=GUARDIAN_MARKUP, parse_mode='HTML')
 
-Поддержите животных зоопарка!
-Узнайте больше на сайте зоопарка.
+# Callback data -> handler
+CALLBACK_HANDLERS = {
+    'about_program': about_program_handler,
+    'start_quiz': start_quiz_handler,
+    'share_result': share_result_handler,
+    'contact': contact_handler,
+    'become_guardian': become_guardian_handler,
+    'back_to_start': back_to_start_handler,
+    'back_to_result': back_to_result_handler,
+}
 
-🌐 moscowzoo.ru/guardianship"""
-    
-    keyboard = [
-        [InlineKeyboardButton("🌐 Перейти на сайт", url="https://moscowzoo.ru")],
-        [InlineKeyboardButton("◀️ Назад", callback_data="back_to_result")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await query.edit_message_text(guardian_text, reply_markup=reply_markup, parse_mode='Markdown')
+async def callback_router(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Dispatch every callback query to its handler."""
+    data = update.callback_query.data
+    
+    handler = CALLBACK_HANDLERS.get(data)
+    if handler:
+        await handler(update, context)
+    elif data and data.startswith('answer_'):
+        await answer_handler(update, context)
+    else:
+        answer_in_background(update, context)
 
 def main():
     """Start the bot."""
-    application = Application.builder().token(BOT_TOKEN).build()
+    if uvloop:
+        # run_polling/run_webhook use the current event loop; uvloop.install()
+        # is deprecated on Python 3.12+
+        asyncio.set_event_loop(uvloop.new_event_loop())
+    
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .concurrent_updates(256)  # process updates from different users in parallel
+        .rate_limiter(AIORateLimiter(
+            overall_max_rate=30,
+            overall_time_period=1,
+            group_max_rate=20,
+            group_time_period=60
+        ))
+        .build()
+    )
     
     # Add handlers
     application.add_handler(CommandHandler("start", start_handler))
-    application.add_handler(CallbackQueryHandler(about_program_handler, pattern="^about_program$"))
-    application.add_handler(CallbackQueryHandler(start_quiz_handler, pattern="^start_quiz$"))
-    application.add_handler(CallbackQueryHandler(answer_handler, pattern="^answer_\\d+$"))
-    application.add_handler(CallbackQueryHandler(share_result_handler, pattern="^share_result$"))
-    application.add_handler(CallbackQueryHandler(contact_handler, pattern="^contact$"))
-    application.add_handler(CallbackQueryHandler(become_guardian_handler, pattern="^become_guardian$"))
-    
-    logger.info("Starting bot...")
-    application.run_polling()
+    application.add_handler(CallbackQueryHandler(callback_router))
+    
+    # Only /start messages and button presses are handled
+    allowed_updates = [Update.MESSAGE, Update.CALLBACK_QUERY]
+    
+    if WEBHOOK_URL:
+        port = int(PORT or 8443)
+        # Telegram pushes updates to us; the token keeps the path unguessable
+        logger.info("Starting bot (webhook on port %d)...", port)
+        application.run_webhook(
+            listen='0.0.0.0',
+            port=port,
+            url_path=BOT_TOKEN,
+            webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{BOT_TOKEN}",
+            allowed_updates=allowed_updates
+        )
+    else:
+        logger.info("Starting bot (polling)...")
+        application.run_polling(poll_interval=0.0, timeout=30, allowed_updates=allowed_updates)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file